@@ -1,10 +1,17 @@
-from sqlalchemy.orm import Session, selectinload
-from sqlalchemy import or_, and_, func
+from sqlalchemy.orm import Session, selectinload, raiseload
+from sqlalchemy import or_, and_, bindparam, case, delete, exists, func, literal, select, union_all, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from collections import Counter, defaultdict
 from datetime import datetime, timedelta
+import os
 import re
 import secrets
 import hashlib
 import json
+import threading
+from cachetools import TTLCache
+from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHashError, VerificationError
 from .models import (
     Recipe,
     Ingredient,
@@ -15,16 +22,32 @@ from .models import (
     RecipeAuthor,
     CommentAuthor,
     RecipeIngredient,
+    RecipeTag,
     RecipeFavorite,
     OnlineDevicePresence,
     CommentLike,
+    RecipeAllowedUser,
 )
 from .schemas import RecipeCreate, IngredientCreate, TagCreate, CommentCreate
 
 
 VALID_QUANTITY_UNITS = {"ml", "cl", "dl", "l", "mg", "g", "kg", "st", "tsk", "msk", "krm"}
 DISPLAY_QUANTITY_UNITS = ["ml", "cl", "dl", "l", "g", "kg", "st", "tsk", "msk", "krm"]
+QUANTITY_NUMBER_CHARS = frozenset("0123456789.,")
 QUANTITY_PATTERN = re.compile(r"^\d+(?:[\.,]\d+)?\s*(ml|cl|dl|l|mg|g|kg|st|tsk|msk|krm)$", re.IGNORECASE)
+TERM_SEPARATOR_PATTERN = re.compile(r"[,;:\n]+")
+WHITESPACE_PATTERN = re.compile(r"\s+")
+# Token -> (user_id, expires_at); role flags are deliberately not cached
+_TOKEN_USER_CACHE = TTLCache(maxsize=10_000, ttl=60)
+_TOKEN_USER_CACHE_LOCK = threading.Lock()
+_SUPER_ADMIN_EXISTS: bool | None = None
+AUTH_TOKEN_TTL = timedelta(days=int(os.getenv("AUTH_TOKEN_TTL_DAYS", "30")))
+# Token -> latest use; flushed to auth_tokens.last_seen_at in batches so authenticated reads never write
+_PENDING_TOKEN_TOUCHES: dict[str, datetime] = {}
+_PENDING_TOKEN_TOUCHES_LOCK = threading.Lock()
+# Window seconds -> online device count; presence windows are minutes long, so a 2 second lag is invisible
+_ONLINE_DEVICE_COUNT_CACHE = TTLCache(maxsize=8, ttl=2)
+_ONLINE_DEVICE_COUNT_CACHE_LOCK = threading.Lock()
 
 
 def _serialize_allergens(allergens: list[str] | None) -> str:
@@ -39,40 +62,148 @@ def _serialize_allergens(allergens: list[str] | None) -> str:
     return json.dumps(normalized)
 
 
-def _hash_password(password: str, salt: str | None = None):
-    final_salt = salt or secrets.token_hex(16)
-    hashed = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), final_salt.encode("utf-8"), 100000)
-    return f"{final_salt}${hashed.hex()}"
+_PASSWORD_HASHER = PasswordHasher(time_cost=2, memory_cost=64 * 1024, parallelism=1)
+# Recent successful verifications, keyed by a keyed digest so plaintext passwords are never held in memory
+_VERIFIED_PASSWORD_CACHE = TTLCache(maxsize=1024, ttl=30)
+_VERIFIED_PASSWORD_CACHE_LOCK = threading.Lock()
+_VERIFIED_PASSWORD_KEY = secrets.token_bytes(32)
 
 
-def _verify_password(password: str, password_hash: str):
+def _hash_password(password: str):
+    return _PASSWORD_HASHER.hash(password)
+
+
+def _legacy_password_digest(password: str, salt: str):
+    return hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt.encode("utf-8"), 100000)
+
+
+def _is_legacy_password_hash(password_hash: str):
+    return not password_hash.startswith("$argon2")
+
+
+def _verified_password_key(password: str, password_hash: str):
+    material = password_hash.encode("utf-8") + b"\0" + password.encode("utf-8")
+    return hashlib.blake2b(material, key=_VERIFIED_PASSWORD_KEY, digest_size=16).digest()
+
+
+def _check_password(password: str, password_hash: str):
+    if _is_legacy_password_hash(password_hash):
+        try:
+            salt, expected_hex = password_hash.split("$", 1)
+            expected = bytes.fromhex(expected_hex)
+        except ValueError:
+            return False
+        return secrets.compare_digest(_legacy_password_digest(password, salt), expected)
     try:
-        salt, _ = password_hash.split("$", 1)
-    except ValueError:
+        return _PASSWORD_HASHER.verify(password_hash, password)
+    except (VerificationError, InvalidHashError):
         return False
-    return _hash_password(password, salt) == password_hash
+
+
+def _verify_password(password: str, password_hash: str):
+    cache_key = _verified_password_key(password, password_hash)
+    with _VERIFIED_PASSWORD_CACHE_LOCK:
+        cached_hash = _VERIFIED_PASSWORD_CACHE.get(cache_key)
+    if cached_hash is not None and secrets.compare_digest(cached_hash, password_hash):
+        return True
+
+    # Only successes are cached, so wrong guesses always pay the full KDF cost
+    if not _check_password(password, password_hash):
+        return False
+    with _VERIFIED_PASSWORD_CACHE_LOCK:
+        _VERIFIED_PASSWORD_CACHE[cache_key] = password_hash
+    return True
+
+
+def _password_needs_rehash(password_hash: str):
+    return _is_legacy_password_hash(password_hash) or _PASSWORD_HASHER.check_needs_rehash(password_hash)
 
 
 def get_user_by_username(db: Session, username: str):
-    return db.query(User).filter(func.lower(User.username) == username.strip().lower()).first()
+    return db.scalar(select(User).where(User.username == username.strip().lower()))
 
 
-def get_user_by_token(db: Session, token: str, touch: bool = False):
-    token_row = db.query(AuthToken).filter(AuthToken.token == token).first()
-    if not token_row:
+def _cached_token_user_id(token: str):
+    with _TOKEN_USER_CACHE_LOCK:
+        cached = _TOKEN_USER_CACHE.get(token)
+    if cached is None:
+        return None
+    user_id, expires_at = cached
+    if expires_at <= datetime.utcnow():
         return None
+    return user_id
+
+
+def _cache_token_user_id(token: str, user_id: int, expires_at: datetime):
+    with _TOKEN_USER_CACHE_LOCK:
+        _TOKEN_USER_CACHE[token] = (user_id, expires_at)
+
+
+def _record_token_touch(token: str, seen_at: datetime):
+    with _PENDING_TOKEN_TOUCHES_LOCK:
+        _PENDING_TOKEN_TOUCHES[token] = seen_at
+
+
+def flush_token_last_seen(db: Session):
+    with _PENDING_TOKEN_TOUCHES_LOCK:
+        pending = dict(_PENDING_TOKEN_TOUCHES)
+        _PENDING_TOKEN_TOUCHES.clear()
+    if not pending:
+        return 0
+    db.execute(
+        update(AuthToken.__table__)
+        .where(AuthToken.token == bindparam("touched_token"))
+        .values(last_seen_at=bindparam("touched_at")),
+        [{"touched_token": token, "touched_at": seen_at} for token, seen_at in pending.items()],
+    )
+    db.commit()
+    return len(pending)
+
+
+def get_user_by_token(db: Session, token: str, touch: bool = False):
+    now = datetime.utcnow()
+    user_id = _cached_token_user_id(token)
+    # The user row is always read by primary key, so role changes apply on every worker immediately
+    user = db.get(User, user_id) if user_id is not None else None
+    if user is None:
+        row = db.execute(
+            select(User, AuthToken.expires_at)
+            .join(AuthToken, AuthToken.user_id == User.id)
+            .where(AuthToken.token == token, AuthToken.expires_at > now)
+        ).first()
+        if row is None:
+            return None
+        user, expires_at = row
+        _cache_token_user_id(token, user.id, expires_at)
     if touch:
-        token_row.last_seen_at = datetime.utcnow()
-        db.commit()
-    return db.query(User).filter(User.id == token_row.user_id).first()
+        _record_token_touch(token, now)
+    return user
+
+
+def delete_expired_auth_tokens(db: Session):
+    deleted = db.query(AuthToken).filter(AuthToken.expires_at <= datetime.utcnow()).delete(synchronize_session=False)
+    db.commit()
+    return deleted
+
+
+def _super_admin_exists(db: Session):
+    # Once a super admin exists it stays that way: update_user_role refuses to demote the last one
+    global _SUPER_ADMIN_EXISTS
+    if not _SUPER_ADMIN_EXISTS:
+        _SUPER_ADMIN_EXISTS = db.scalar(select(exists().where(User.is_super_admin)))
+    return _SUPER_ADMIN_EXISTS
+
+
+def _mark_super_admin_exists():
+    global _SUPER_ADMIN_EXISTS
+    _SUPER_ADMIN_EXISTS = True
 
 
 def register_user(db: Session, username: str, password: str):
     normalized = username.strip().lower()
     if get_user_by_username(db, normalized):
         return None
-    has_super_admin = db.query(User.id).filter(User.is_super_admin.is_(True)).first() is not None
-    first_privileged = not has_super_admin
+    first_privileged = not _super_admin_exists(db)
     user = User(
         username=normalized,
         password_hash=_hash_password(password),
@@ -81,12 +212,13 @@ def register_user(db: Session, username: str, password: str):
     )
     db.add(user)
     db.commit()
-    db.refresh(user)
+    if first_privileged:
+        _mark_super_admin_exists()
     return user
 
 
 def get_users(db: Session):
-    return db.query(User).order_by(func.lower(User.username)).all()
+    return db.query(User).order_by(User.username).all()
 
 
 def update_user_role(db: Session, user_id: int, role: str):
@@ -99,7 +231,7 @@ def update_user_role(db: Session, user_id: int, role: str):
         raise ValueError("Invalid role")
 
     if user.is_super_admin and normalized_role != "super_admin":
-        super_admin_count = db.query(User.id).filter(User.is_super_admin.is_(True)).count()
+        super_admin_count = db.query(User.id).filter(User.is_super_admin).count()
         if super_admin_count <= 1:
             raise ValueError("At least one super admin is required")
 
@@ -114,7 +246,6 @@ def update_user_role(db: Session, user_id: int, role: str):
         user.is_admin = False
 
     db.commit()
-    db.refresh(user)
     return user
 
 
@@ -124,8 +255,10 @@ def login_user(db: Session, username: str, password: str):
         return None
     if not _verify_password(password, user.password_hash):
         return None
+    if _password_needs_rehash(user.password_hash):
+        user.password_hash = _hash_password(password)
     token_value = secrets.token_urlsafe(32)
-    token = AuthToken(user_id=user.id, token=token_value)
+    token = AuthToken(user_id=user.id, token=token_value, expires_at=datetime.utcnow() + AUTH_TOKEN_TTL)
     db.add(token)
     db.commit()
     return token_value, user
@@ -133,27 +266,31 @@ def login_user(db: Session, username: str, password: str):
 
 def get_online_device_count(db: Session, window_seconds: int = 300):
     safe_window = max(30, int(window_seconds or 300))
+    with _ONLINE_DEVICE_COUNT_CACHE_LOCK:
+        cached_count = _ONLINE_DEVICE_COUNT_CACHE.get(safe_window)
+    if cached_count is not None:
+        return cached_count
+
     threshold = datetime.utcnow() - timedelta(seconds=safe_window)
-    rows = db.query(
-        OnlineDevicePresence.device_id,
-        OnlineDevicePresence.user_id,
-        OnlineDevicePresence.user_agent,
-    ).filter(
+    normalized_agent = func.lower(func.trim(OnlineDevicePresence.user_agent))
+    device_key = case(
+        (
+            and_(OnlineDevicePresence.user_id.isnot(None), func.length(normalized_agent) > 0),
+            func.concat("user:", OnlineDevicePresence.user_id, ":agent:", normalized_agent),
+        ),
+        (
+            OnlineDevicePresence.user_id.isnot(None),
+            func.concat("user:", OnlineDevicePresence.user_id, ":device:", OnlineDevicePresence.device_id),
+        ),
+        else_=func.concat("anon:", OnlineDevicePresence.device_id),
+    )
+    count = db.query(func.count(func.distinct(device_key))).filter(
         OnlineDevicePresence.last_seen_at >= threshold
-    ).all()
-
-    unique_keys = set()
-    for device_id, user_id, user_agent in rows:
-        normalized_agent = (user_agent or "").strip().lower()
-        if user_id is not None and normalized_agent:
-            unique_keys.add(f"user:{int(user_id)}:agent:{normalized_agent}")
-            continue
-        if user_id is not None:
-            unique_keys.add(f"user:{int(user_id)}:device:{device_id}")
-            continue
-        unique_keys.add(f"anon:{device_id}")
-
-    return len(unique_keys)
+    ).scalar()
+    count = int(count or 0)
+    with _ONLINE_DEVICE_COUNT_CACHE_LOCK:
+        _ONLINE_DEVICE_COUNT_CACHE[safe_window] = count
+    return count
 
 
 def touch_online_device(db: Session, device_id: str, user_id: int | None = None, user_agent: str | None = None):
@@ -161,25 +298,41 @@ def touch_online_device(db: Session, device_id: str, user_id: int | None = None,
     if not normalized_device_id:
         return
 
-    row = db.query(OnlineDevicePresence).filter(OnlineDevicePresence.device_id == normalized_device_id).first()
     now = datetime.utcnow()
     normalized_user_agent = (user_agent or "").strip() or None
-    if row is None:
-        db.add(
-            OnlineDevicePresence(
-                device_id=normalized_device_id,
-                user_id=user_id,
-                user_agent=normalized_user_agent,
-                last_seen_at=now,
-            )
-        )
-    else:
-        row.last_seen_at = now
-        if user_id is not None:
-            row.user_id = user_id
-        if normalized_user_agent is not None:
-            row.user_agent = normalized_user_agent
+    stmt = pg_insert(OnlineDevicePresence).values(
+        device_id=normalized_device_id,
+        user_id=user_id,
+        user_agent=normalized_user_agent,
+        last_seen_at=now,
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[OnlineDevicePresence.device_id],
+        set_={
+            "last_seen_at": stmt.excluded.last_seen_at,
+            "user_id": func.coalesce(stmt.excluded.user_id, OnlineDevicePresence.user_id),
+            "user_agent": func.coalesce(stmt.excluded.user_agent, OnlineDevicePresence.user_agent),
+        },
+    )
+    # Subqueries in RETURNING read the snapshot from before this statement, i.e. the previous heartbeat
+    previous_seen_at = db.execute(stmt.returning(
+        select(OnlineDevicePresence.last_seen_at)
+        .where(OnlineDevicePresence.device_id == normalized_device_id)
+        .scalar_subquery()
+    )).scalar()
     db.commit()
+    _evict_counts_missing_device(previous_seen_at, now)
+
+
+def _evict_counts_missing_device(previous_seen_at: datetime | None, now: datetime):
+    # Cached counts for windows this device had dropped out of no longer include it
+    with _ONLINE_DEVICE_COUNT_CACHE_LOCK:
+        stale_windows = [
+            window for window in _ONLINE_DEVICE_COUNT_CACHE
+            if previous_seen_at is None or previous_seen_at < now - timedelta(seconds=window)
+        ]
+        for window in stale_windows:
+            _ONLINE_DEVICE_COUNT_CACHE.pop(window, None)
 
 
 def remove_online_device(db: Session, device_id: str):
@@ -192,32 +345,55 @@ def remove_online_device(db: Session, device_id: str):
         return
     db.delete(row)
     db.commit()
-
-def get_recipes(db: Session):
-    recipes = db.query(Recipe).options(
+    # The offline endpoint replies with the count right after this, so it must not see the cached value
+    with _ONLINE_DEVICE_COUNT_CACHE_LOCK:
+        _ONLINE_DEVICE_COUNT_CACHE.clear()
+
+def _visible_recipes(stmt, viewer: User | None):
+    # Applied in SQL ahead of OFFSET/LIMIT so pages are counted over recipes the viewer can actually see
+    if viewer is not None and (viewer.is_admin or viewer.is_super_admin):
+        return stmt
+    if viewer is None:
+        return stmt.where(Recipe.is_public)
+    return stmt.where(or_(
+        Recipe.is_public,
+        exists().where(RecipeAuthor.recipe_id == Recipe.id, RecipeAuthor.user_id == viewer.id),
+        exists().where(RecipeAllowedUser.recipe_id == Recipe.id, RecipeAllowedUser.user_id == viewer.id),
+    ))
+
+
+def _paginate_recipes(stmt, limit: int | None, offset: int):
+    if limit is None and not offset:
+        return stmt
+    # A stable order keeps pages from overlapping; selectinload then only fetches this page's children
+    return stmt.order_by(Recipe.id).offset(offset).limit(limit)
+
+
+def get_recipes(db: Session, viewer: User | None = None, limit: int | None = None, offset: int = 0):
+    stmt = select(Recipe).options(
         selectinload(Recipe.ingredients),
         selectinload(Recipe.tags),
-        selectinload(Recipe.comments)
-    ).all()
-    _attach_recipe_authors(db, recipes)
-    _attach_favorite_counts(db, recipes)
+        selectinload(Recipe.comments),
+        raiseload("*")
+    )
+    recipes = list(db.scalars(_paginate_recipes(_visible_recipes(stmt, viewer), limit, offset)))
     _attach_ingredient_measurements(db, recipes)
-    _attach_comment_authors(db, recipes)
     return recipes
 
 def get_recipe(db: Session, recipe_id: int):
-    recipe = db.query(Recipe).options(
+    recipe = db.scalar(select(Recipe).options(
         selectinload(Recipe.ingredients),
         selectinload(Recipe.tags),
-        selectinload(Recipe.comments)
-    ).filter(Recipe.id == recipe_id).first()
+        selectinload(Recipe.comments),
+        raiseload("*")
+    ).where(Recipe.id == recipe_id))
     if recipe:
-        _attach_recipe_authors(db, [recipe])
-        _attach_favorite_counts(db, [recipe])
         _attach_ingredient_measurements(db, [recipe])
-        _attach_comment_authors(db, [recipe])
     return recipe
 
+def recipe_exists(db: Session, recipe_id: int) -> bool:
+    return db.scalar(select(exists().where(Recipe.id == recipe_id)))
+
 def create_recipe(db: Session, recipe: RecipeCreate, user_id: int):
     recipe_data = recipe.dict(exclude={"ingredients", "tags", "allowed_usernames"})
     recipe_data["allergens"] = _serialize_allergens(recipe.allergens)
@@ -226,35 +402,14 @@ def create_recipe(db: Session, recipe: RecipeCreate, user_id: int):
     db.flush()
 
     ingredient_entries = _extract_ingredient_entries(recipe.ingredients or [])
-    ingredients = []
-    ingredient_by_name = {}
-    missing_ingredients = []
-    for name, _ in ingredient_entries:
-        existing = db.query(Ingredient).filter(func.lower(Ingredient.name) == name).first()
-        if not existing:
-            missing_ingredients.append(name)
-            continue
-        ingredients.append(existing)
-        ingredient_by_name[name] = existing
-
-    if missing_ingredients:
-        unique_missing = sorted(set(missing_ingredients))
-        raise ValueError(f"Unknown ingredients: {', '.join(unique_missing)}. Add them to the ingredient list first.")
-
-    tag_names = _extract_unique_names(recipe.tags or [], "tags")
-    tags = []
-    for name in tag_names:
-        existing = db.query(Tag).filter(func.lower(Tag.name) == name).first()
-        if not existing:
-            existing = Tag(name=name)
-            db.add(existing)
-            db.flush()
-        tags.append(existing)
+    ingredients, ingredient_by_name = _resolve_recipe_ingredients(db, ingredient_entries)
+    tags = _resolve_recipe_tags(db, _extract_unique_names(recipe.tags or [], "tags"))
 
     db_recipe.ingredients = ingredients
     db_recipe.tags = tags
     db.flush()
     _apply_recipe_ingredient_quantities(db, db_recipe.id, ingredient_entries, ingredient_by_name)
+    _adjust_ingredient_recipe_counts(db, {ingredient.id for ingredient in ingredients}, 1)
     db.add(RecipeAuthor(recipe_id=db_recipe.id, user_id=user_id))
 
     # Handle allowed users for private recipes
@@ -263,11 +418,7 @@ def create_recipe(db: Session, recipe: RecipeCreate, user_id: int):
         allowed_users = db.query(User).filter(User.username.in_(allowed_usernames)).all() if allowed_usernames else []
         db_recipe.allowed_users = allowed_users
     db.commit()
-    db.refresh(db_recipe)
-    _attach_recipe_authors(db, [db_recipe])
-    _attach_favorite_counts(db, [db_recipe])
     _attach_ingredient_measurements(db, [db_recipe])
-    _attach_comment_authors(db, [db_recipe])
     return db_recipe
 
 
@@ -276,7 +427,8 @@ def update_recipe(db: Session, recipe_id: int, recipe: RecipeCreate):
         selectinload(Recipe.ingredients),
         selectinload(Recipe.tags),
         selectinload(Recipe.comments),
-        selectinload(Recipe.allowed_users)
+        selectinload(Recipe.allowed_users),
+        raiseload("*")
     ).filter(Recipe.id == recipe_id).first()
     if db_recipe is None:
         return None
@@ -287,35 +439,17 @@ def update_recipe(db: Session, recipe_id: int, recipe: RecipeCreate):
         setattr(db_recipe, field, value)
 
     ingredient_entries = _extract_ingredient_entries(recipe.ingredients or [])
-    ingredients = []
-    ingredient_by_name = {}
-    missing_ingredients = []
-    for name, _ in ingredient_entries:
-        existing = db.query(Ingredient).filter(func.lower(Ingredient.name) == name).first()
-        if not existing:
-            missing_ingredients.append(name)
-            continue
-        ingredients.append(existing)
-        ingredient_by_name[name] = existing
-
-    if missing_ingredients:
-        unique_missing = sorted(set(missing_ingredients))
-        raise ValueError(f"Unknown ingredients: {', '.join(unique_missing)}. Add them to the ingredient list first.")
-
-    tag_names = _extract_unique_names(recipe.tags or [], "tags")
-    tags = []
-    for name in tag_names:
-        existing = db.query(Tag).filter(func.lower(Tag.name) == name).first()
-        if not existing:
-            existing = Tag(name=name)
-            db.add(existing)
-            db.flush()
-        tags.append(existing)
+    ingredients, ingredient_by_name = _resolve_recipe_ingredients(db, ingredient_entries)
+    tags = _resolve_recipe_tags(db, _extract_unique_names(recipe.tags or [], "tags"))
 
+    previous_ingredient_ids = {ingredient.id for ingredient in db_recipe.ingredients}
+    ingredient_ids = {ingredient.id for ingredient in ingredients}
     db_recipe.ingredients = ingredients
     db_recipe.tags = tags
     db.flush()
     _apply_recipe_ingredient_quantities(db, db_recipe.id, ingredient_entries, ingredient_by_name)
+    _adjust_ingredient_recipe_counts(db, ingredient_ids - previous_ingredient_ids, 1)
+    _adjust_ingredient_recipe_counts(db, previous_ingredient_ids - ingredient_ids, -1)
 
     if not recipe.is_public:
         allowed_usernames = recipe.allowed_usernames or []
@@ -325,11 +459,7 @@ def update_recipe(db: Session, recipe_id: int, recipe: RecipeCreate):
         db_recipe.allowed_users = []
 
     db.commit()
-    db.refresh(db_recipe)
-    _attach_recipe_authors(db, [db_recipe])
-    _attach_favorite_counts(db, [db_recipe])
     _attach_ingredient_measurements(db, [db_recipe])
-    _attach_comment_authors(db, [db_recipe])
     db_recipe.allowed_usernames = [u.username for u in db_recipe.allowed_users] if db_recipe.allowed_users else []
     return db_recipe
 
@@ -342,26 +472,25 @@ def delete_recipe(db: Session, recipe_id: int):
             db.query(CommentAuthor).filter(CommentAuthor.comment_id.in_(comment_ids)).delete(synchronize_session=False)
         db.query(RecipeFavorite).filter(RecipeFavorite.recipe_id == recipe_id).delete(synchronize_session=False)
         db.query(RecipeAuthor).filter(RecipeAuthor.recipe_id == recipe_id).delete(synchronize_session=False)
+        _adjust_ingredient_recipe_counts(db, {ingredient.id for ingredient in db_recipe.ingredients}, -1)
         db.delete(db_recipe)
         db.commit()
     return db_recipe
 
 
 def get_favorite_recipe_ids(db: Session, user_id: int):
-    rows = db.query(RecipeFavorite.recipe_id).filter(RecipeFavorite.user_id == user_id).all()
-    return [recipe_id for (recipe_id,) in rows]
+    return list(db.scalars(select(RecipeFavorite.recipe_id).where(RecipeFavorite.user_id == user_id)))
 
 
 def add_recipe_favorite(db: Session, recipe_id: int, user_id: int):
-    recipe_exists = db.query(Recipe.id).filter(Recipe.id == recipe_id).first()
-    if recipe_exists is None:
+    if not recipe_exists(db, recipe_id):
         return None
 
-    existing = db.query(RecipeFavorite).filter(
+    already_favorite = db.scalar(select(exists().where(and_(
         RecipeFavorite.recipe_id == recipe_id,
         RecipeFavorite.user_id == user_id,
-    ).first()
-    if existing is None:
+    ))))
+    if not already_favorite:
         db.add(RecipeFavorite(recipe_id=recipe_id, user_id=user_id))
         db.commit()
 
@@ -369,33 +498,36 @@ def add_recipe_favorite(db: Session, recipe_id: int, user_id: int):
 
 
 def remove_recipe_favorite(db: Session, recipe_id: int, user_id: int):
-    favorite = db.query(RecipeFavorite).filter(
+    deleted = db.query(RecipeFavorite).filter(
         RecipeFavorite.recipe_id == recipe_id,
         RecipeFavorite.user_id == user_id,
-    ).first()
-    if favorite is None:
-        return {"recipe_id": recipe_id}
-
-    db.delete(favorite)
-    db.commit()
+    ).delete(synchronize_session=False)
+    if deleted:
+        db.commit()
     return {"recipe_id": recipe_id}
 
 
 def is_recipe_owner(db: Session, recipe_id: int, user_id: int):
-    return db.query(RecipeAuthor).filter(
+    return db.scalar(select(exists().where(and_(
         RecipeAuthor.recipe_id == recipe_id,
         RecipeAuthor.user_id == user_id,
-    ).first() is not None
+    ))))
 
 
 def _split_terms(query: str):
-    terms = [t.strip() for t in re.split(r"[,;:\n]+", query or "")]
-    return [t for t in terms if t]
+    return [t for t in (s.strip() for s in TERM_SEPARATOR_PATTERN.split(query or "")) if t]
 
 def _split_names(value: str):
     return _split_terms(value)
 
 
+def _raise_on_duplicates(names: list[str], field_label: str):
+    if len(set(names)) == len(names):
+        return
+    duplicates = [name for name, count in Counter(names).items() if count > 1]
+    raise ValueError(f"Duplicate {field_label}: {', '.join(duplicates)}")
+
+
 def _extract_unique_names(items: list[IngredientCreate | TagCreate], field_label: str):
     names = []
     for item in items:
@@ -404,16 +536,7 @@ def _extract_unique_names(items: list[IngredientCreate | TagCreate], field_label
             if normalized:
                 names.append(normalized)
 
-    seen = set()
-    duplicates = []
-    for name in names:
-        if name in seen and name not in duplicates:
-            duplicates.append(name)
-        seen.add(name)
-
-    if duplicates:
-        raise ValueError(f"Duplicate {field_label}: {', '.join(duplicates)}")
-
+    _raise_on_duplicates(names, field_label)
     return names
 
 
@@ -426,17 +549,7 @@ def _extract_ingredient_entries(items: list[IngredientCreate]):
             if normalized:
                 entries.append((normalized, quantity))
 
-    names = [name for name, _ in entries]
-    seen = set()
-    duplicates = []
-    for name in names:
-        if name in seen and name not in duplicates:
-            duplicates.append(name)
-        seen.add(name)
-
-    if duplicates:
-        raise ValueError(f"Duplicate ingredients: {', '.join(duplicates)}")
-
+    _raise_on_duplicates([name for name, _ in entries], "ingredients")
     return entries
 
 
@@ -445,7 +558,18 @@ def _normalize_quantity(raw_quantity: str | None):
     if not value:
         return None
 
-    compact = re.sub(r"\s+", "", value)
+    # Fast path for the common "2 dl" / "100g" shape; anything else goes through QUANTITY_PATTERN
+    end = 0
+    while end < len(value) and value[end] in QUANTITY_NUMBER_CHARS:
+        end += 1
+    unit = value[end:].lstrip()
+    if unit in VALID_QUANTITY_UNITS:
+        number = value[:end].replace(",", ".")
+        whole, separator, fraction = number.partition(".")
+        if whole.isdigit() and (not separator or fraction.isdigit()):
+            return f"{number} {unit}"
+
+    compact = WHITESPACE_PATTERN.sub("", value)
     match = QUANTITY_PATTERN.match(compact)
     if not match:
         raise ValueError(f"Use EU units ({', '.join(DISPLAY_QUANTITY_UNITS)}) e.g. flour: 2 dl")
@@ -458,89 +582,149 @@ def _normalize_quantity(raw_quantity: str | None):
     return f"{number} {unit}".replace(",", ".")
 
 
+def _resolve_recipe_ingredients(db: Session, ingredient_entries: list[tuple[str, str | None]]):
+    names = {name for name, _ in ingredient_entries}
+    existing = {}
+    if names:
+        rows = db.query(Ingredient).filter(func.lower(Ingredient.name).in_(names)).all()
+        existing = {row.name.lower(): row for row in rows}
+
+    missing_ingredients = names - existing.keys()
+    if missing_ingredients:
+        unique_missing = sorted(missing_ingredients)
+        raise ValueError(f"Unknown ingredients: {', '.join(unique_missing)}. Add them to the ingredient list first.")
+
+    ingredients = [existing[name] for name, _ in ingredient_entries]
+    ingredient_by_name = {name: existing[name] for name, _ in ingredient_entries}
+    return ingredients, ingredient_by_name
+
+
+def _resolve_recipe_tags(db: Session, tag_names: list[str]):
+    existing = {}
+    if tag_names:
+        rows = db.query(Tag).filter(func.lower(Tag.name).in_(tag_names)).all()
+        existing = {row.name.lower(): row for row in rows}
+
+    missing_names = [name for name in tag_names if name not in existing]
+    if missing_names:
+        # ON CONFLICT keeps a concurrent request creating the same tag from failing this one
+        insert_missing = (
+            pg_insert(Tag)
+            .values([{"name": name} for name in missing_names])
+            .on_conflict_do_nothing(index_elements=[func.lower(Tag.name)])
+            .returning(Tag)
+        )
+        existing.update({tag.name: tag for tag in db.scalars(insert_missing)})
+        raced_names = [name for name in missing_names if name not in existing]
+        if raced_names:
+            rows = db.query(Tag).filter(func.lower(Tag.name).in_(raced_names)).all()
+            existing.update({row.name.lower(): row for row in rows})
+
+    return [existing[name] for name in tag_names]
+
+
+def _adjust_ingredient_recipe_counts(db: Session, ingredient_ids: set[int], delta: int):
+    if not ingredient_ids:
+        return
+    db.query(Ingredient).filter(Ingredient.id.in_(ingredient_ids)).update(
+        {Ingredient.recipe_count: Ingredient.recipe_count + delta},
+        synchronize_session="evaluate",
+    )
+
+
 def _apply_recipe_ingredient_quantities(
     db: Session,
     recipe_id: int,
     ingredient_entries: list[tuple[str, str | None]],
     ingredient_by_name: dict[str, Ingredient],
 ):
-    for name, quantity in ingredient_entries:
-        ingredient = ingredient_by_name.get(name)
-        if ingredient is None:
-            continue
-        row = db.query(RecipeIngredient).filter(
-            RecipeIngredient.recipe_id == recipe_id,
-            RecipeIngredient.ingredient_id == ingredient.id,
-        ).first()
-        if row:
-            row.quantity = quantity
+    mappings = [
+        {"recipe_id": recipe_id, "ingredient_id": ingredient_by_name[name].id, "quantity": quantity}
+        for name, quantity in ingredient_entries
+        if name in ingredient_by_name
+    ]
+    if mappings:
+        db.execute(update(RecipeIngredient), mappings)
+
+def _name_matches(column, term: str):
+    return column.ilike(f"%{term}%")
+
+
+def _recipe_text_matches(term: str):
+    return or_(
+        Recipe.title.ilike(f"%{term}%"),
+        Recipe.description.ilike(f"%{term}%")
+    )
+
 
-def search_recipes(db: Session, query: str, scope: str = "all"):
+def _recipe_ids_matching_all_terms(terms: list[str]):
+    # One UNION ALL of (recipe_id, term index) hits across recipes, ingredients and tags,
+    # grouped so a recipe qualifies only when every term matched somewhere
+    branches = []
+    for index, term in enumerate(terms):
+        term_index = literal(index).label("term_index")
+        branches.append(
+            select(Recipe.id.label("recipe_id"), term_index).where(_recipe_text_matches(term))
+        )
+        branches.append(
+            select(RecipeIngredient.recipe_id, term_index)
+            .join(Ingredient, Ingredient.id == RecipeIngredient.ingredient_id)
+            .where(_name_matches(Ingredient.name, term))
+        )
+        branches.append(
+            select(RecipeTag.recipe_id, term_index)
+            .join(Tag, Tag.id == RecipeTag.tag_id)
+            .where(_name_matches(Tag.name, term))
+        )
+
+    hits = union_all(*branches).subquery()
+    return (
+        select(hits.c.recipe_id)
+        .group_by(hits.c.recipe_id)
+        .having(func.count(func.distinct(hits.c.term_index)) == len(terms))
+    )
+
+
+def search_recipes(
+    db: Session,
+    query: str,
+    scope: str = "all",
+    viewer: User | None = None,
+    limit: int | None = None,
+    offset: int = 0,
+):
     terms = _split_terms(query)
-    base = db.query(Recipe).options(
+    base = select(Recipe).options(
         selectinload(Recipe.ingredients),
         selectinload(Recipe.tags),
-        selectinload(Recipe.comments)
+        selectinload(Recipe.comments),
+        raiseload("*")
     )
 
-    def _with_authors(results: list[Recipe]):
-        _attach_recipe_authors(db, results)
-        _attach_favorite_counts(db, results)
-        _attach_ingredient_measurements(db, results)
-        _attach_comment_authors(db, results)
-        return results
-
-    if not terms:
-        return _with_authors(base.all())
-
-    if scope == "name":
-        clauses = [or_(
-            Recipe.title.ilike(f"%{t}%"),
-            Recipe.description.ilike(f"%{t}%")
-        ) for t in terms]
-        return _with_authors(base.filter(and_(*clauses)).all())
-    if scope == "ingredients":
-        clauses = [
-            Recipe.ingredients.any(Ingredient.name.ilike(f"%{t}%"))
-            for t in terms
-        ]
-        return _with_authors(base.filter(and_(*clauses)).all())
-    if scope == "tags":
-        clauses = [
-            Recipe.tags.any(Tag.name.ilike(f"%{t}%"))
-            for t in terms
-        ]
-        return _with_authors(base.filter(and_(*clauses)).all())
-
-    clauses = [or_(
-        Recipe.title.ilike(f"%{t}%"),
-        Recipe.description.ilike(f"%{t}%"),
-        Recipe.ingredients.any(Ingredient.name.ilike(f"%{t}%")),
-        Recipe.tags.any(Tag.name.ilike(f"%{t}%"))
-    ) for t in terms]
-    return _with_authors(base.filter(and_(*clauses)).all())
+    # Substring ILIKE so words inside compounds still match ("socker" finds "strösocker");
+    # the pg_trgm GIN indexes serve these where the extension is installed
+    clauses = []
+    if terms and scope not in {"name", "ingredients", "tags"}:
+        clauses.append(Recipe.id.in_(_recipe_ids_matching_all_terms(terms)))
+    else:
+        for term in terms:
+            if scope == "name":
+                clauses.append(_recipe_text_matches(term))
+            elif scope == "ingredients":
+                clauses.append(Recipe.ingredients.any(_name_matches(Ingredient.name, term)))
+            else:
+                clauses.append(Recipe.tags.any(_name_matches(Tag.name, term)))
+
+    if clauses:
+        base = base.where(and_(*clauses))
+    recipes = list(db.scalars(_paginate_recipes(_visible_recipes(base, viewer), limit, offset)))
+    _attach_ingredient_measurements(db, recipes)
+    return recipes
 
 # Ingredients
 
 def get_ingredients(db: Session):
-    ingredients = db.query(Ingredient).order_by(func.lower(Ingredient.name)).all()
-    ingredient_ids = [item.id for item in ingredients]
-    if not ingredient_ids:
-        return ingredients
-
-    rows = db.query(
-        RecipeIngredient.ingredient_id,
-        func.count(RecipeIngredient.recipe_id),
-    ).filter(
-        RecipeIngredient.ingredient_id.in_(ingredient_ids)
-    ).group_by(
-        RecipeIngredient.ingredient_id
-    ).all()
-
-    recipe_counts = {ingredient_id: int(count) for ingredient_id, count in rows}
-    for ingredient in ingredients:
-        ingredient.recipe_count = recipe_counts.get(ingredient.id, 0)
-    return ingredients
+    return db.query(Ingredient).order_by(func.lower(Ingredient.name)).all()
 
 def create_ingredient(db: Session, ingredient: IngredientCreate):
     normalized_name = (ingredient.name or "").strip().lower()
@@ -554,8 +738,6 @@ def create_ingredient(db: Session, ingredient: IngredientCreate):
     db_ingredient = Ingredient(name=normalized_name)
     db.add(db_ingredient)
     db.commit()
-    db.refresh(db_ingredient)
-    db_ingredient.recipe_count = 0
     return db_ingredient
 
 
@@ -577,12 +759,6 @@ def update_ingredient(db: Session, ingredient_id: int, name: str):
 
     db_ingredient.name = normalized_name
     db.commit()
-    db.refresh(db_ingredient)
-
-    recipe_count = db.query(func.count(RecipeIngredient.recipe_id)).filter(
-        RecipeIngredient.ingredient_id == ingredient_id
-    ).scalar() or 0
-    db_ingredient.recipe_count = int(recipe_count)
     return db_ingredient
 
 
@@ -591,13 +767,12 @@ def delete_ingredient(db: Session, ingredient_id: int):
     if db_ingredient is None:
         return None
 
-    in_use = db.query(RecipeIngredient.recipe_id).filter(RecipeIngredient.ingredient_id == ingredient_id).first()
-    if in_use is not None:
+    in_use = db.scalar(select(exists().where(RecipeIngredient.ingredient_id == ingredient_id)))
+    if in_use:
         raise ValueError("Cannot delete ingredient that is used by recipes")
 
     db.delete(db_ingredient)
     db.commit()
-    db_ingredient.recipe_count = 0
     return db_ingredient
 
 # Tags
@@ -610,31 +785,14 @@ def create_tag(db: Session, tag: TagCreate):
     db_tag = Tag(**data)
     db.add(db_tag)
     db.commit()
-    db.refresh(db_tag)
     return db_tag
 
 
 # Comments
 def get_recipe_comments(db: Session, recipe_id: int):
-    comments = db.query(RecipeComment).filter(RecipeComment.recipe_id == recipe_id).order_by(RecipeComment.created_at.desc()).all()
-    comment_ids = [item.id for item in comments]
-    if not comment_ids:
-        return comments
-    rows = db.query(CommentAuthor.comment_id, User.username).join(User, User.id == CommentAuthor.user_id).filter(CommentAuthor.comment_id.in_(comment_ids)).all()
-    authors = {comment_id: username for comment_id, username in rows}
-    like_rows = db.query(
-        CommentLike.comment_id,
-        func.count(CommentLike.user_id),
-    ).filter(
-        CommentLike.comment_id.in_(comment_ids)
-    ).group_by(
-        CommentLike.comment_id
-    ).all()
-    like_counts = {comment_id: int(count) for comment_id, count in like_rows}
-    for comment in comments:
-        comment.created_by_username = authors.get(comment.id)
-        comment.like_count = like_counts.get(comment.id, 0)
-    return comments
+    return list(db.scalars(
+        select(RecipeComment).where(RecipeComment.recipe_id == recipe_id).order_by(RecipeComment.created_at.desc())
+    ))
 
 
 def create_recipe_comment(db: Session, recipe_id: int, comment: CommentCreate, user_id: int):
@@ -643,23 +801,39 @@ def create_recipe_comment(db: Session, recipe_id: int, comment: CommentCreate, u
     db.flush()
     db.add(CommentAuthor(comment_id=db_comment.id, user_id=user_id))
     db.commit()
-    db.refresh(db_comment)
-    db_comment.created_by_username = db.query(User.username).filter(User.id == user_id).scalar()
-    db_comment.like_count = 0
     return db_comment
 
 
-def delete_recipe_comment(db: Session, recipe_id: int, comment_id: int):
-    db_comment = db.query(RecipeComment).filter(
-        RecipeComment.id == comment_id,
-        RecipeComment.recipe_id == recipe_id,
-    ).first()
-    if db_comment:
-        db.query(CommentLike).filter(CommentLike.comment_id == comment_id).delete(synchronize_session=False)
-        db.query(CommentAuthor).filter(CommentAuthor.comment_id == comment_id).delete(synchronize_session=False)
-        db.delete(db_comment)
-        db.commit()
-    return db_comment
+def delete_comment_if_owner(db: Session, recipe_id: int, comment_id: int, user_id: int):
+    # One round trip: the author row is only deleted when user_id owns this comment on this recipe,
+    # and the likes and the comment itself are deleted through it; FK checks run at statement end
+    comment_authors = CommentAuthor.__table__
+    comment_likes = CommentLike.__table__
+    recipe_comments = RecipeComment.__table__
+    owned = delete(comment_authors).where(
+        comment_authors.c.comment_id == comment_id,
+        comment_authors.c.user_id == user_id,
+        exists().where(recipe_comments.c.id == comment_id, recipe_comments.c.recipe_id == recipe_id),
+    ).returning(comment_authors.c.comment_id).cte("owned_comment")
+    deleted_likes = delete(comment_likes).where(
+        comment_likes.c.comment_id.in_(select(owned.c.comment_id))
+    ).returning(comment_likes.c.user_id).cte("deleted_likes")
+    row = db.execute(
+        delete(recipe_comments).where(
+            recipe_comments.c.id.in_(select(owned.c.comment_id))
+        ).returning(
+            recipe_comments.c.id,
+            recipe_comments.c.recipe_id,
+            recipe_comments.c.content,
+            recipe_comments.c.created_at,
+            select(User.username).where(User.id == user_id).scalar_subquery().label("created_by_username"),
+            select(func.count()).select_from(deleted_likes).scalar_subquery().label("like_count"),
+        )
+    ).one_or_none()
+    if row is None:
+        return None
+    db.commit()
+    return dict(row._mapping)
 
 
 def delete_comment_any(db: Session, comment_id: int):
@@ -678,22 +852,6 @@ def get_all_comments(db: Session):
     if not comment_ids:
         return comments
 
-    author_rows = db.query(CommentAuthor.comment_id, User.username).join(
-        User,
-        User.id == CommentAuthor.user_id,
-    ).filter(CommentAuthor.comment_id.in_(comment_ids)).all()
-    authors = {comment_id: username for comment_id, username in author_rows}
-
-    like_rows = db.query(
-        CommentLike.comment_id,
-        func.count(CommentLike.user_id),
-    ).filter(
-        CommentLike.comment_id.in_(comment_ids)
-    ).group_by(
-        CommentLike.comment_id
-    ).all()
-    like_counts = {comment_id: int(count) for comment_id, count in like_rows}
-
     recipe_rows = db.query(
         RecipeComment.id,
         Recipe.id,
@@ -704,93 +862,62 @@ def get_all_comments(db: Session):
     recipe_titles = {comment_id: title for comment_id, _, title in recipe_rows}
 
     for comment in comments:
-        comment.created_by_username = authors.get(comment.id)
-        comment.like_count = like_counts.get(comment.id, 0)
         comment.recipe_title = recipe_titles.get(comment.id)
     return comments
 
 
 def get_liked_comment_ids(db: Session, recipe_id: int, user_id: int):
-    rows = db.query(CommentLike.comment_id).join(
-        RecipeComment,
-        RecipeComment.id == CommentLike.comment_id,
-    ).filter(
-        CommentLike.user_id == user_id,
-        RecipeComment.recipe_id == recipe_id,
-    ).all()
-    return [comment_id for (comment_id,) in rows]
+    return list(db.scalars(
+        select(CommentLike.comment_id).join(
+            RecipeComment,
+            RecipeComment.id == CommentLike.comment_id,
+        ).where(
+            CommentLike.user_id == user_id,
+            RecipeComment.recipe_id == recipe_id,
+        )
+    ))
 
 
 def add_comment_like(db: Session, recipe_id: int, comment_id: int, user_id: int):
-    comment_exists = db.query(RecipeComment.id).filter(
+    comment_exists = db.scalar(select(exists().where(and_(
         RecipeComment.id == comment_id,
         RecipeComment.recipe_id == recipe_id,
-    ).first()
-    if comment_exists is None:
+    ))))
+    if not comment_exists:
         return None
 
-    existing = db.query(CommentLike).filter(
+    already_liked = db.scalar(select(exists().where(and_(
         CommentLike.comment_id == comment_id,
         CommentLike.user_id == user_id,
-    ).first()
-    if existing is None:
+    ))))
+    if not already_liked:
         db.add(CommentLike(comment_id=comment_id, user_id=user_id))
         db.commit()
     return {"comment_id": comment_id}
 
 
 def remove_comment_like(db: Session, recipe_id: int, comment_id: int, user_id: int):
-    comment_exists = db.query(RecipeComment.id).filter(
+    comment_exists = db.scalar(select(exists().where(and_(
         RecipeComment.id == comment_id,
         RecipeComment.recipe_id == recipe_id,
-    ).first()
-    if comment_exists is None:
+    ))))
+    if not comment_exists:
         return None
 
-    like = db.query(CommentLike).filter(
+    deleted = db.query(CommentLike).filter(
         CommentLike.comment_id == comment_id,
         CommentLike.user_id == user_id,
-    ).first()
-    if like is not None:
-        db.delete(like)
+    ).delete(synchronize_session=False)
+    if deleted:
         db.commit()
     return {"comment_id": comment_id}
 
 
 def is_comment_owner(db: Session, comment_id: int, user_id: int):
-    return db.query(CommentAuthor).filter(
+    return db.scalar(select(exists().where(and_(
         CommentAuthor.comment_id == comment_id,
         CommentAuthor.user_id == user_id,
-    ).first() is not None
-
-
-def _attach_recipe_authors(db: Session, recipes: list[Recipe]):
-    recipe_ids = [recipe.id for recipe in recipes]
-    if not recipe_ids:
-        return
-    rows = db.query(RecipeAuthor.recipe_id, User.username).join(User, User.id == RecipeAuthor.user_id).filter(RecipeAuthor.recipe_id.in_(recipe_ids)).all()
-    authors = {recipe_id: username for recipe_id, username in rows}
-    for recipe in recipes:
-        recipe.created_by_username = authors.get(recipe.id)
-
-
-def _attach_favorite_counts(db: Session, recipes: list[Recipe]):
-    recipe_ids = [recipe.id for recipe in recipes]
-    if not recipe_ids:
-        return
-
-    rows = db.query(
-        RecipeFavorite.recipe_id,
-        func.count(RecipeFavorite.user_id),
-    ).filter(
-        RecipeFavorite.recipe_id.in_(recipe_ids)
-    ).group_by(
-        RecipeFavorite.recipe_id
-    ).all()
-
-    counts = {recipe_id: int(count) for recipe_id, count in rows}
-    for recipe in recipes:
-        recipe.favorite_count = counts.get(recipe.id, 0)
+    ))))
 
 
 def _attach_ingredient_measurements(db: Session, recipes: list[Recipe]):
@@ -807,36 +934,9 @@ def _attach_ingredient_measurements(db: Session, recipes: list[Recipe]):
         RecipeIngredient.recipe_id.in_(recipe_ids)
     ).all()
 
-    by_recipe_id: dict[int, list[dict]] = {recipe_id: [] for recipe_id in recipe_ids}
+    by_recipe_id: defaultdict[int, list[dict]] = defaultdict(list)
     for recipe_id, ingredient_id, name, quantity in rows:
-        by_recipe_id.setdefault(recipe_id, []).append(
-            {
-                "ingredient_id": ingredient_id,
-                "name": name,
-                "quantity": quantity,
-            }
-        )
+        by_recipe_id[recipe_id].append({"ingredient_id": ingredient_id, "name": name, "quantity": quantity})
 
     for recipe in recipes:
         recipe.ingredient_measurements = by_recipe_id.get(recipe.id, [])
-
-
-def _attach_comment_authors(db: Session, recipes: list[Recipe]):
-    comments = [comment for recipe in recipes for comment in (recipe.comments or [])]
-    comment_ids = [comment.id for comment in comments]
-    if not comment_ids:
-        return
-    rows = db.query(CommentAuthor.comment_id, User.username).join(User, User.id == CommentAuthor.user_id).filter(CommentAuthor.comment_id.in_(comment_ids)).all()
-    authors = {comment_id: username for comment_id, username in rows}
-    like_rows = db.query(
-        CommentLike.comment_id,
-        func.count(CommentLike.user_id),
-    ).filter(
-        CommentLike.comment_id.in_(comment_ids)
-    ).group_by(
-        CommentLike.comment_id
-    ).all()
-    like_counts = {comment_id: int(count) for comment_id, count in like_rows}
-    for comment in comments:
-        comment.created_by_username = authors.get(comment.id)
-        comment.like_count = like_counts.get(comment.id, 0)
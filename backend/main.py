@@ -1,219 +1,340 @@
+import asyncio
+import logging
 import os
-from fastapi import FastAPI, Depends, HTTPException, Header
+import anyio.to_thread
+from contextlib import asynccontextmanager, suppress
+from fastapi import FastAPI, Depends, HTTPException, Header, Query
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.orm import Session
-from sqlalchemy import inspect, text
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
 from . import crud, models, schemas
-from .database import engine, get_db, Base
+from .database import engine, get_db, Base, SessionLocal, DB_POOL_SIZE, DB_MAX_OVERFLOW
 
+logger = logging.getLogger(__name__)
 
-def ensure_recipes_servings_column():
-    inspector = inspect(engine)
-    table_names = set(inspector.get_table_names())
-    if "recipes" not in table_names:
+
+def column_missing(schema: dict[str, set[str]], table_name: str, column_name: str):
+    # Tables missing from the snapshot have nothing to migrate
+    return table_name in schema and column_name not in schema[table_name]
+
+
+def ensure_recipes_servings_column(connection, schema: dict[str, set[str]]):
+    columns = schema.get("recipes")
+    if columns is None:
         return
-    columns = {column["name"] for column in inspector.get_columns("recipes")}
     if "servings" not in columns:
-        with engine.begin() as connection:
-            connection.execute(text("ALTER TABLE recipes ADD COLUMN servings INTEGER"))
+        connection.execute(text("ALTER TABLE recipes ADD COLUMN servings INTEGER"))
     if "is_public" not in columns:
-        with engine.begin() as connection:
-            connection.execute(text("ALTER TABLE recipes ADD COLUMN is_public BOOLEAN NOT NULL DEFAULT TRUE"))
+        connection.execute(text("ALTER TABLE recipes ADD COLUMN is_public BOOLEAN NOT NULL DEFAULT TRUE"))
     if "instructions" not in columns:
-        with engine.begin() as connection:
-            connection.execute(text("ALTER TABLE recipes ADD COLUMN instructions TEXT"))
+        connection.execute(text("ALTER TABLE recipes ADD COLUMN instructions TEXT"))
     if "allergens" not in columns:
-        with engine.begin() as connection:
-            connection.execute(text("ALTER TABLE recipes ADD COLUMN allergens TEXT"))
-
-def ensure_recipe_allowed_users_table():
-    inspector = inspect(engine)
-    table_names = set(inspector.get_table_names())
-    if "recipe_allowed_users" not in table_names:
-        from . import models
-        models.RecipeAllowedUser.__table__.create(bind=engine, checkfirst=True)
-
-ensure_recipe_allowed_users_table()
+        connection.execute(text("ALTER TABLE recipes ADD COLUMN allergens TEXT"))
 
-ensure_recipes_servings_column()
+def ensure_recipe_allowed_users_table(connection, schema: dict[str, set[str]]):
+    if "recipe_allowed_users" not in schema:
+        models.RecipeAllowedUser.__table__.create(bind=connection, checkfirst=True)
 
 ONLINE_DEVICE_WINDOW_SECONDS = int(os.getenv("ONLINE_DEVICE_WINDOW_SECONDS", "120"))
-
-# Create tables
-Base.metadata.create_all(bind=engine)
+MAX_RECIPE_PAGE_SIZE = int(os.getenv("MAX_RECIPE_PAGE_SIZE", "200"))
+AUTH_TOKEN_CLEANUP_INTERVAL_SECONDS = int(os.getenv("AUTH_TOKEN_CLEANUP_INTERVAL_SECONDS", "3600"))
+TOKEN_LAST_SEEN_FLUSH_SECONDS = int(os.getenv("TOKEN_LAST_SEEN_FLUSH_SECONDS", "30"))
+# Sync handlers, background tasks and the periodic jobs all share anyio's worker threads (40 by default).
+# One thread per pooled connection plus headroom for threadpool work that is not holding a connection,
+# so a saturated pool does not also starve heartbeats and token flushes of threads
+WORKER_THREAD_HEADROOM = 20
+WORKER_THREADS = int(os.getenv("WORKER_THREADS", str(DB_POOL_SIZE + DB_MAX_OVERFLOW + WORKER_THREAD_HEADROOM)))
+
+
+def ensure_pg_trgm_extension(connection):
+    # Savepoint: a missing extension must not abort the surrounding migration transaction
+    try:
+        with connection.begin_nested():
+            connection.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+    except SQLAlchemyError:
+        logger.warning("pg_trgm extension is unavailable; substring search will not use trigram indexes")
 
 
-def ensure_recipe_favorites_table():
-    inspector = inspect(engine)
-    table_names = set(inspector.get_table_names())
-    if "recipe_favorites" in table_names:
+def ensure_recipe_favorites_table(connection, schema: dict[str, set[str]]):
+    if "recipe_favorites" in schema:
         return
-    models.RecipeFavorite.__table__.create(bind=engine, checkfirst=True)
-
-
-ensure_recipe_favorites_table()
+    models.RecipeFavorite.__table__.create(bind=connection, checkfirst=True)
 
 
-def ensure_comment_likes_table():
-    inspector = inspect(engine)
-    table_names = set(inspector.get_table_names())
-    if "comment_likes" in table_names:
+def ensure_comment_likes_table(connection, schema: dict[str, set[str]]):
+    if "comment_likes" in schema:
         return
-    models.CommentLike.__table__.create(bind=engine, checkfirst=True)
+    models.CommentLike.__table__.create(bind=connection, checkfirst=True)
 
 
-ensure_comment_likes_table()
-
-
-def ensure_online_device_presence_table():
-    inspector = inspect(engine)
-    table_names = set(inspector.get_table_names())
-    if "online_device_presence" in table_names:
+def ensure_online_device_presence_table(connection, schema: dict[str, set[str]]):
+    if "online_device_presence" in schema:
         return
-    models.OnlineDevicePresence.__table__.create(bind=engine, checkfirst=True)
-
+    models.OnlineDevicePresence.__table__.create(bind=connection, checkfirst=True)
 
-ensure_online_device_presence_table()
 
-
-def ensure_online_device_presence_user_agent_column():
-    inspector = inspect(engine)
-    table_names = set(inspector.get_table_names())
-    if "online_device_presence" not in table_names:
-        return
-    columns = {column["name"] for column in inspector.get_columns("online_device_presence")}
-    if "user_agent" in columns:
+def ensure_online_device_presence_user_agent_column(connection, schema: dict[str, set[str]]):
+    if not column_missing(schema, "online_device_presence", "user_agent"):
         return
-    with engine.begin() as connection:
-        connection.execute(text("ALTER TABLE online_device_presence ADD COLUMN user_agent TEXT"))
-
+    connection.execute(text("ALTER TABLE online_device_presence ADD COLUMN user_agent TEXT"))
 
-ensure_online_device_presence_user_agent_column()
 
-
-def ensure_auth_tokens_last_seen_column():
-    inspector = inspect(engine)
-    table_names = set(inspector.get_table_names())
-    if "auth_tokens" not in table_names:
-        return
-    columns = {column["name"] for column in inspector.get_columns("auth_tokens")}
-    if "last_seen_at" in columns:
+def ensure_ingredients_recipe_count_column(connection, schema: dict[str, set[str]]):
+    if not column_missing(schema, "ingredients", "recipe_count"):
         return
-    with engine.begin() as connection:
-        connection.execute(
-            text("ALTER TABLE auth_tokens ADD COLUMN last_seen_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP")
+    connection.execute(text("ALTER TABLE ingredients ADD COLUMN recipe_count INTEGER NOT NULL DEFAULT 0"))
+    connection.execute(
+        text(
+            """
+            UPDATE ingredients i
+            SET recipe_count = (
+                SELECT COUNT(*) FROM recipe_ingredients ri WHERE ri.ingredient_id = i.id
+            )
+            """
         )
+    )
 
 
-ensure_auth_tokens_last_seen_column()
+def ensure_auth_tokens_last_seen_column(connection, schema: dict[str, set[str]]):
+    if not column_missing(schema, "auth_tokens", "last_seen_at"):
+        return
+    connection.execute(
+        text("ALTER TABLE auth_tokens ADD COLUMN last_seen_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP")
+    )
 
 
-def ensure_users_admin_column():
-    inspector = inspect(engine)
-    table_names = set(inspector.get_table_names())
-    if "users" not in table_names:
-        return
-    columns = {column["name"] for column in inspector.get_columns("users")}
-    if "is_admin" in columns:
+def ensure_users_admin_column(connection, schema: dict[str, set[str]]):
+    if not column_missing(schema, "users", "is_admin"):
         return
-    with engine.begin() as connection:
-        connection.execute(text("ALTER TABLE users ADD COLUMN is_admin BOOLEAN NOT NULL DEFAULT FALSE"))
+    connection.execute(text("ALTER TABLE users ADD COLUMN is_admin BOOLEAN NOT NULL DEFAULT FALSE"))
 
 
-ensure_users_admin_column()
+def ensure_users_super_admin_column(connection, schema: dict[str, set[str]]):
+    if not column_missing(schema, "users", "is_super_admin"):
+        return
+    connection.execute(text("ALTER TABLE users ADD COLUMN is_super_admin BOOLEAN NOT NULL DEFAULT FALSE"))
 
 
-def ensure_users_super_admin_column():
-    inspector = inspect(engine)
-    table_names = set(inspector.get_table_names())
-    if "users" not in table_names:
+def ensure_auth_tokens_expires_column(connection, schema: dict[str, set[str]]):
+    if not column_missing(schema, "auth_tokens", "expires_at"):
         return
-    columns = {column["name"] for column in inspector.get_columns("users")}
-    if "is_super_admin" in columns:
+    connection.execute(text("ALTER TABLE auth_tokens ADD COLUMN expires_at TIMESTAMP"))
+    # Existing sessions get the same lifetime as new ones, counted from when they were issued
+    connection.execute(
+        text(
+            "UPDATE auth_tokens SET expires_at = COALESCE(created_at, CURRENT_TIMESTAMP) "
+            "+ make_interval(secs => :ttl_seconds)"
+        ),
+        {"ttl_seconds": crud.AUTH_TOKEN_TTL.total_seconds()},
+    )
+    connection.execute(text("ALTER TABLE auth_tokens ALTER COLUMN expires_at SET NOT NULL"))
+
+
+def ensure_at_least_one_admin(connection):
+    has_admin = connection.execute(text("SELECT EXISTS (SELECT 1 FROM users WHERE is_admin)")).scalar()
+    if has_admin:
         return
-    with engine.begin() as connection:
-        connection.execute(text("ALTER TABLE users ADD COLUMN is_super_admin BOOLEAN NOT NULL DEFAULT FALSE"))
-
-
-ensure_users_super_admin_column()
-
-
-def ensure_at_least_one_admin():
-    with engine.begin() as connection:
-        admin_count = connection.execute(text("SELECT COUNT(*) FROM users WHERE is_admin = TRUE")).scalar()
-        if admin_count and int(admin_count) > 0:
-            return
-        first_user_id = connection.execute(text("SELECT id FROM users ORDER BY id ASC LIMIT 1")).scalar()
-        if first_user_id is None:
-            return
-        connection.execute(text("UPDATE users SET is_admin = TRUE WHERE id = :user_id"), {"user_id": int(first_user_id)})
+    first_user_id = connection.execute(text("SELECT id FROM users ORDER BY id ASC LIMIT 1")).scalar()
+    if first_user_id is None:
+        return
+    connection.execute(text("UPDATE users SET is_admin = TRUE WHERE id = :user_id"), {"user_id": int(first_user_id)})
 
 
-ensure_at_least_one_admin()
+def ensure_at_least_one_super_admin(connection):
+    # Bare column predicate so the probe can use the ix_users_super_admin_id partial index
+    has_super_admin = connection.execute(text("SELECT EXISTS (SELECT 1 FROM users WHERE is_super_admin)")).scalar()
+    if has_super_admin:
+        return
 
+    first_admin_user_id = connection.execute(text("SELECT id FROM users WHERE is_admin = TRUE ORDER BY id ASC LIMIT 1")).scalar()
+    if first_admin_user_id is None:
+        first_admin_user_id = connection.execute(text("SELECT id FROM users ORDER BY id ASC LIMIT 1")).scalar()
+    if first_admin_user_id is None:
+        return
+    connection.execute(
+        text("UPDATE users SET is_super_admin = TRUE, is_admin = TRUE WHERE id = :user_id"),
+        {"user_id": int(first_admin_user_id)},
+    )
+
+
+def ensure_recipe_author_links(connection):
+    fallback_user_id = connection.execute(
+        text("SELECT id FROM users WHERE is_admin = TRUE ORDER BY id ASC LIMIT 1")
+    ).scalar()
+    if fallback_user_id is None:
+        fallback_user_id = connection.execute(text("SELECT id FROM users ORDER BY id ASC LIMIT 1")).scalar()
+    if fallback_user_id is None:
+        return
 
-def ensure_at_least_one_super_admin():
+    connection.execute(
+        text(
+            """
+            INSERT INTO recipe_authors (recipe_id, user_id)
+            SELECT r.id, :user_id
+            FROM recipes r
+            LEFT JOIN recipe_authors ra ON ra.recipe_id = r.id
+            WHERE ra.recipe_id IS NULL
+            """
+        ),
+        {"user_id": int(fallback_user_id)},
+    )
+
+
+def ensure_model_indexes(connection):
+    # create_all skips tables that already exist, so indexes added to the models later are created here;
+    # this runs after the column migrations above so indexes may reference those columns
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=connection, checkfirst=True)
+
+
+def ensure_superseded_indexes_dropped(connection):
+    # ix_auth_tokens_token_user keeps token uniqueness and also covers user_id;
+    # ix_recipe_comments_recipe_created leads with recipe_id;
+    # the author link id indexes repeat their primary keys, which the *_user indexes also cover
+    connection.execute(text("DROP INDEX IF EXISTS ix_auth_tokens_token"))
+    connection.execute(text("DROP INDEX IF EXISTS ix_recipe_comments_recipe_id"))
+    connection.execute(text("DROP INDEX IF EXISTS ix_recipe_authors_recipe_id"))
+    connection.execute(text("DROP INDEX IF EXISTS ix_comment_authors_comment_id"))
+
+
+def load_schema_snapshot(connection):
+    # One catalog query up front instead of an inspector round trip per table in every ensure_* step
+    rows = connection.execute(
+        text(
+            "SELECT table_name, column_name FROM information_schema.columns "
+            "WHERE table_schema = current_schema()"
+        )
+    )
+    schema: dict[str, set[str]] = {}
+    for table_name, column_name in rows:
+        schema.setdefault(table_name, set()).add(column_name)
+    return schema
+
+
+def apply_startup_migrations(connection):
+    ensure_pg_trgm_extension(connection)
+    Base.metadata.create_all(bind=connection)
+    schema = load_schema_snapshot(connection)
+    ensure_recipe_allowed_users_table(connection, schema)
+    ensure_recipes_servings_column(connection, schema)
+    ensure_recipe_favorites_table(connection, schema)
+    ensure_comment_likes_table(connection, schema)
+    ensure_online_device_presence_table(connection, schema)
+    ensure_online_device_presence_user_agent_column(connection, schema)
+    ensure_ingredients_recipe_count_column(connection, schema)
+    ensure_auth_tokens_last_seen_column(connection, schema)
+    ensure_auth_tokens_expires_column(connection, schema)
+    ensure_users_admin_column(connection, schema)
+    ensure_users_super_admin_column(connection, schema)
+    ensure_at_least_one_admin(connection)
+    ensure_at_least_one_super_admin(connection)
+    ensure_recipe_author_links(connection)
+    ensure_model_indexes(connection)
+    ensure_superseded_indexes_dropped(connection)
+
+
+# Arbitrary application-wide key for pg_advisory_xact_lock
+STARTUP_MIGRATION_LOCK_KEY = 724_513_901
+# Bump whenever a model or an ensure_* step changes so existing databases run the migrations again
+SCHEMA_VERSION = "1"
+
+
+def read_schema_version(connection):
+    if connection.execute(text("SELECT to_regclass('schema_meta')")).scalar() is None:
+        return None
+    return connection.execute(text("SELECT version FROM schema_meta LIMIT 1")).scalar()
+
+
+def write_schema_version(connection):
+    connection.execute(text("CREATE TABLE IF NOT EXISTS schema_meta (version TEXT NOT NULL)"))
+    connection.execute(text("DELETE FROM schema_meta"))
+    connection.execute(text("INSERT INTO schema_meta (version) VALUES (:version)"), {"version": SCHEMA_VERSION})
+
+
+def run_startup_migrations():
+    # All steps share one transaction, so a failed boot leaves the schema untouched. Workers booting
+    # together queue on the transaction-scoped advisory lock: the first one migrates and the rest
+    # see the version marker it wrote, so no two processes race on the same DDL
     with engine.begin() as connection:
-        super_admin_count = connection.execute(text("SELECT COUNT(*) FROM users WHERE is_super_admin = TRUE")).scalar()
-        if super_admin_count and int(super_admin_count) > 0:
+        connection.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": STARTUP_MIGRATION_LOCK_KEY})
+        if read_schema_version(connection) == SCHEMA_VERSION:
             return
-
-        first_admin_user_id = connection.execute(text("SELECT id FROM users WHERE is_admin = TRUE ORDER BY id ASC LIMIT 1")).scalar()
-        if first_admin_user_id is None:
-            first_admin_user_id = connection.execute(text("SELECT id FROM users ORDER BY id ASC LIMIT 1")).scalar()
-        if first_admin_user_id is None:
-            return
-        connection.execute(
-            text("UPDATE users SET is_super_admin = TRUE, is_admin = TRUE WHERE id = :user_id"),
-            {"user_id": int(first_admin_user_id)},
-        )
-
-
-ensure_at_least_one_super_admin()
+        apply_startup_migrations(connection)
+        write_schema_version(connection)
 
 
-def ensure_recipe_author_links():
-    with engine.begin() as connection:
-        fallback_user_id = connection.execute(
-            text("SELECT id FROM users WHERE is_admin = TRUE ORDER BY id ASC LIMIT 1")
-        ).scalar()
-        if fallback_user_id is None:
-            fallback_user_id = connection.execute(text("SELECT id FROM users ORDER BY id ASC LIMIT 1")).scalar()
-        if fallback_user_id is None:
-            return
+def delete_expired_auth_tokens():
+    db = SessionLocal()
+    try:
+        deleted = crud.delete_expired_auth_tokens(db)
+    finally:
+        db.close()
+    if deleted:
+        logger.info("Deleted %d expired auth tokens", deleted)
 
-        connection.execute(
-            text(
-                """
-                INSERT INTO recipe_authors (recipe_id, user_id)
-                SELECT r.id, :user_id
-                FROM recipes r
-                LEFT JOIN recipe_authors ra ON ra.recipe_id = r.id
-                WHERE ra.recipe_id IS NULL
-                """
-            ),
-            {"user_id": int(fallback_user_id)},
-        )
 
+def flush_token_last_seen():
+    db = SessionLocal()
+    try:
+        crud.flush_token_last_seen(db)
+    finally:
+        db.close()
+
+
+async def run_periodically(job, interval_seconds: int):
+    while True:
+        try:
+            await run_in_threadpool(job)
+        except SQLAlchemyError:
+            logger.exception("Periodic job %s failed", job.__name__)
+        await asyncio.sleep(interval_seconds)
+
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    anyio.to_thread.current_default_thread_limiter().total_tokens = WORKER_THREADS
+    await run_in_threadpool(run_startup_migrations)
+    background_jobs = [
+        asyncio.create_task(run_periodically(delete_expired_auth_tokens, AUTH_TOKEN_CLEANUP_INTERVAL_SECONDS)),
+        asyncio.create_task(run_periodically(flush_token_last_seen, TOKEN_LAST_SEEN_FLUSH_SECONDS)),
+    ]
+    try:
+        yield
+    finally:
+        for job in background_jobs:
+            job.cancel()
+        for job in background_jobs:
+            with suppress(asyncio.CancelledError):
+                await job
+        # Keep the touches recorded since the last flush
+        await run_in_threadpool(flush_token_last_seen)
 
-ensure_recipe_author_links()
 
-app = FastAPI(title="Recipe API")
+app = FastAPI(title="Recipe API", lifespan=lifespan)
 
-default_origins = [
+DEFAULT_CORS_ORIGINS = (
     "http://localhost:5173",
     "http://127.0.0.1:5173",
     "http://localhost:3000",
     "http://127.0.0.1:3000",
-]
-allowed_origins = [
-    origin.strip() for origin in os.getenv("CORS_ORIGINS", ",".join(default_origins)).split(",") if origin.strip()
-]
+)
+
+
+def parse_cors_origins(raw_origins: str | None):
+    if raw_origins is None:
+        return list(DEFAULT_CORS_ORIGINS)
+    return [origin for origin in (item.strip() for item in raw_origins.split(",")) if origin]
+
+
+ALLOWED_ORIGINS = parse_cors_origins(os.getenv("CORS_ORIGINS"))
 
 # Allow cross-origin requests from frontend dev servers
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=allowed_origins,
+    allow_origins=ALLOWED_ORIGINS,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
@@ -249,18 +370,18 @@ def root():
     return {"message": "Recipe API is running"}
 
 
-@app.get("/presence/online-devices", response_model=schemas.OnlineDevicesResponse)
-def read_online_devices(db: Session = Depends(get_db)):
-    return {"online_devices": crud.get_online_device_count(db, ONLINE_DEVICE_WINDOW_SECONDS)}
+@app.get("/presence/online-devices")
+def read_online_devices(db: Session = Depends(get_db)) -> schemas.OnlineDevicesResponse:
+    return schemas.OnlineDevicesResponse(online_devices=crud.get_online_device_count(db, ONLINE_DEVICE_WINDOW_SECONDS))
 
 
-@app.post("/presence/heartbeat", response_model=schemas.OnlineDevicesResponse)
+@app.post("/presence/heartbeat")
 def presence_heartbeat(
     payload: schemas.PresenceHeartbeatRequest,
     authorization: str | None = Header(default=None),
     user_agent: str | None = Header(default=None),
     db: Session = Depends(get_db),
-):
+) -> schemas.OnlineDevicesResponse:
     user_id: int | None = None
     if authorization and authorization.startswith("Bearer "):
         token = authorization.removeprefix("Bearer ").strip()
@@ -269,17 +390,18 @@ def presence_heartbeat(
             if user is not None:
                 user_id = user.id
 
+    # Upsert first so the count below includes this device, also when it is coming back from a stale row
     crud.touch_online_device(db, payload.device_id, user_id=user_id, user_agent=user_agent)
-    return {"online_devices": crud.get_online_device_count(db, ONLINE_DEVICE_WINDOW_SECONDS)}
+    return schemas.OnlineDevicesResponse(online_devices=crud.get_online_device_count(db, ONLINE_DEVICE_WINDOW_SECONDS))
 
 
-@app.post("/presence/offline", response_model=schemas.OnlineDevicesResponse)
+@app.post("/presence/offline")
 def presence_offline(
     payload: schemas.PresenceHeartbeatRequest,
     db: Session = Depends(get_db),
-):
+) -> schemas.OnlineDevicesResponse:
     crud.remove_online_device(db, payload.device_id)
-    return {"online_devices": crud.get_online_device_count(db, ONLINE_DEVICE_WINDOW_SECONDS)}
+    return schemas.OnlineDevicesResponse(online_devices=crud.get_online_device_count(db, ONLINE_DEVICE_WINDOW_SECONDS))
 
 
 @app.post("/auth/register", response_model=schemas.UserPublic)
@@ -355,6 +477,8 @@ bearer_scheme = HTTPBearer(auto_error=False)
 def read_recipes(
     query: str | None = None,
     scope: str = "all",
+    limit: int | None = Query(default=None, ge=1, le=MAX_RECIPE_PAGE_SIZE),
+    offset: int = Query(default=0, ge=0),
     db: Session = Depends(get_db),
     credentials: HTTPAuthorizationCredentials = Security(bearer_scheme),
 ):
@@ -368,26 +492,13 @@ def read_recipes(
         allowed = {"all", "name", "ingredients", "tags"}
         if scope not in allowed:
             raise HTTPException(status_code=400, detail="Invalid scope")
-        recipes = crud.search_recipes(db, query, scope=scope)
+        recipes = crud.search_recipes(db, query, scope=scope, viewer=user, limit=limit, offset=offset)
     else:
-        recipes = crud.get_recipes(db)
-
-    # Admins and superadmins see all recipes; others only see public or allowed/private
-    if user and (user.is_admin or user.is_super_admin):
-        return recipes
-
-    visible = []
-    for recipe in recipes:
-        if recipe.is_public:
-            visible.append(recipe)
-        elif user:
-            allowed_usernames = set(getattr(recipe, 'allowed_usernames', []) or [])
-            if (
-                user.username == getattr(recipe, 'created_by_username', None)
-                or user.username in allowed_usernames
-            ):
-                visible.append(recipe)
-    return visible
+        recipes = crud.get_recipes(db, viewer=user, limit=limit, offset=offset)
+
+    # Admins and superadmins see all recipes; others only see public ones, their own,
+    # and private ones they were granted; the filter runs in SQL before paging
+    return recipes
 
 @app.get("/recipes/favorites", response_model=schemas.RecipeFavoriteList)
 def read_favorites(
@@ -483,8 +594,7 @@ def update_recipe(
 
 @app.get("/recipes/{recipe_id}/comments", response_model=list[schemas.Comment])
 def read_recipe_comments(recipe_id: int, db: Session = Depends(get_db)):
-    recipe = crud.get_recipe(db, recipe_id)
-    if recipe is None:
+    if not crud.recipe_exists(db, recipe_id):
         raise HTTPException(status_code=404, detail="Recipe not found")
     return crud.get_recipe_comments(db, recipe_id)
 
@@ -496,8 +606,7 @@ def add_recipe_comment(
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user),
 ):
-    recipe = crud.get_recipe(db, recipe_id)
-    if recipe is None:
+    if not crud.recipe_exists(db, recipe_id):
         raise HTTPException(status_code=404, detail="Recipe not found")
     if not comment.content.strip():
         raise HTTPException(status_code=400, detail="Comment content is required")
@@ -511,17 +620,16 @@ def remove_recipe_comment(
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user),
 ):
-    recipe = crud.get_recipe(db, recipe_id)
-    if recipe is None:
-        raise HTTPException(status_code=404, detail="Recipe not found")
+    deleted_comment = crud.delete_comment_if_owner(db, recipe_id, comment_id, current_user.id)
+    if deleted_comment is not None:
+        return deleted_comment
 
+    # Nothing was deleted; only now work out which check failed
+    if not crud.recipe_exists(db, recipe_id):
+        raise HTTPException(status_code=404, detail="Recipe not found")
     if not crud.is_comment_owner(db, comment_id, current_user.id):
         raise HTTPException(status_code=403, detail="Only the comment author can remove this comment")
-
-    deleted_comment = crud.delete_recipe_comment(db, recipe_id, comment_id)
-    if deleted_comment is None:
-        raise HTTPException(status_code=404, detail="Comment not found")
-    return deleted_comment
+    raise HTTPException(status_code=404, detail="Comment not found")
 
 
 @app.get("/admin/comments", response_model=list[schemas.Comment])
@@ -552,8 +660,7 @@ def read_comment_likes(
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user),
 ):
-    recipe = crud.get_recipe(db, recipe_id)
-    if recipe is None:
+    if not crud.recipe_exists(db, recipe_id):
         raise HTTPException(status_code=404, detail="Recipe not found")
     comment_ids = crud.get_liked_comment_ids(db, recipe_id=recipe_id, user_id=current_user.id)
     return {"comment_ids": comment_ids}
@@ -585,12 +692,18 @@ def remove_comment_like(
     return result
 
 @app.get("/recipes/search", response_model=list[schemas.Recipe])
-def search(query: str, scope: str = "all", db: Session = Depends(get_db)):
+def search(
+    query: str,
+    scope: str = "all",
+    limit: int | None = Query(default=None, ge=1, le=MAX_RECIPE_PAGE_SIZE),
+    offset: int = Query(default=0, ge=0),
+    db: Session = Depends(get_db),
+):
     scope = scope.strip().lower()
     allowed = {"all", "name", "ingredients", "tags"}
     if scope not in allowed:
         raise HTTPException(status_code=400, detail="Invalid scope")
-    return crud.search_recipes(db, query, scope=scope)
+    return crud.search_recipes(db, query, scope=scope, limit=limit, offset=offset)
 
 # Ingredients
 @app.post("/ingredients/", response_model=schemas.Ingredient)
@@ -1,9 +1,23 @@
-from sqlalchemy import Column, Integer, Text, ForeignKey, TIMESTAMP, Index, Boolean
+from sqlalchemy import Column, Integer, Text, ForeignKey, TIMESTAMP, Index, Boolean, select, text
 from sqlalchemy.sql import func
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, column_property
 from .database import Base
 
 
+def _pg_trgm_installed(ddl, target, bind, **kw):
+    return bind.execute(text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")).scalar() is not None
+
+
+def trigram_index(name: str, column: str):
+    # Serves the ILIKE '%term%' recipe search; skipped where the pg_trgm extension is unavailable
+    return Index(
+        name,
+        column,
+        postgresql_using="gin",
+        postgresql_ops={column: "gin_trgm_ops"},
+    ).ddl_if(callable_=_pg_trgm_installed)
+
+
 class User(Base):
     __tablename__ = "users"
     id = Column(Integer, primary_key=True, index=True)
@@ -13,28 +27,49 @@ class User(Base):
     is_super_admin = Column(Boolean, nullable=False, default=False, server_default="false")
     created_at = Column(TIMESTAMP, server_default=func.now())
 
+    __table_args__ = (
+        # Partial index: super admin probes filter on the bare column so the planner can match this predicate
+        Index("ix_users_super_admin_id", id, postgresql_where=is_super_admin),
+    )
+
 
 class AuthToken(Base):
     __tablename__ = "auth_tokens"
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
-    token = Column(Text, nullable=False, unique=True, index=True)
+    token = Column(Text, nullable=False)
     created_at = Column(TIMESTAMP, server_default=func.now())
     last_seen_at = Column(TIMESTAMP, nullable=False, server_default=func.now())
+    expires_at = Column(TIMESTAMP, nullable=False, index=True)
     user = relationship("User")
 
+    __table_args__ = (
+        # Covering unique index: token lookups joined to users never touch the heap
+        Index("ix_auth_tokens_token_user", token, unique=True, postgresql_include=["user_id"]),
+    )
+
 
 class RecipeAuthor(Base):
     __tablename__ = "recipe_authors"
-    recipe_id = Column(Integer, ForeignKey("recipes.id"), primary_key=True, index=True)
+    recipe_id = Column(Integer, ForeignKey("recipes.id"), primary_key=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
 
+    __table_args__ = (
+        # Stands in for a plain recipe_id index: ownership probes and author lookups read user_id from it
+        Index("ix_recipe_authors_recipe_user", recipe_id, postgresql_include=["user_id"]),
+    )
+
 
 class CommentAuthor(Base):
     __tablename__ = "comment_authors"
-    comment_id = Column(Integer, ForeignKey("recipe_comments.id"), primary_key=True, index=True)
+    comment_id = Column(Integer, ForeignKey("recipe_comments.id"), primary_key=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
 
+    __table_args__ = (
+        # Stands in for a plain comment_id index: ownership probes and author lookups read user_id from it
+        Index("ix_comment_authors_comment_user", comment_id, postgresql_include=["user_id"]),
+    )
+
 
 class CommentLike(Base):
     __tablename__ = "comment_likes"
@@ -42,6 +77,10 @@ class CommentLike(Base):
     user_id = Column(Integer, ForeignKey("users.id"), primary_key=True, index=True)
     created_at = Column(TIMESTAMP, server_default=func.now())
 
+    __table_args__ = (
+        Index("ix_comment_likes_user_comment", user_id, comment_id),
+    )
+
 
 class RecipeFavorite(Base):
     __tablename__ = "recipe_favorites"
@@ -49,6 +88,10 @@ class RecipeFavorite(Base):
     user_id = Column(Integer, ForeignKey("users.id"), primary_key=True, index=True)
     created_at = Column(TIMESTAMP, server_default=func.now())
 
+    __table_args__ = (
+        Index("ix_recipe_favorites_user_recipe", user_id, recipe_id),
+    )
+
 
 class OnlineDevicePresence(Base):
     __tablename__ = "online_device_presence"
@@ -57,6 +100,12 @@ class OnlineDevicePresence(Base):
     user_agent = Column(Text, nullable=True)
     last_seen_at = Column(TIMESTAMP, nullable=False, server_default=func.now())
 
+    __table_args__ = (
+        # Online count is a range scan on last_seen_at. It also reads user_agent, an unbounded client-supplied
+        # header that must stay out of any index payload, so the matching rows come from the heap either way
+        Index("ix_online_device_presence_last_seen", last_seen_at),
+    )
+
 class RecipeAllowedUser(Base):
     __tablename__ = "recipe_allowed_users"
     recipe_id = Column(Integer, ForeignKey("recipes.id"), primary_key=True)
@@ -79,15 +128,35 @@ class Recipe(Base):
     tags = relationship("Tag", secondary="recipetags", back_populates="recipes")
     comments = relationship("RecipeComment", back_populates="recipe", cascade="all, delete-orphan")
     allowed_users = relationship("User", secondary="recipe_allowed_users")
+    created_by_username = column_property(
+        select(User.username)
+        .join(RecipeAuthor, RecipeAuthor.user_id == User.id)
+        .where(RecipeAuthor.recipe_id == id)
+        .correlate_except(RecipeAuthor, User)
+        .scalar_subquery()
+    )
+    favorite_count = column_property(
+        select(func.count(RecipeFavorite.user_id))
+        .where(RecipeFavorite.recipe_id == id)
+        .correlate_except(RecipeFavorite)
+        .scalar_subquery()
+    )
+
+    __table_args__ = (
+        trigram_index("ix_recipes_title_trgm", "title"),
+        trigram_index("ix_recipes_description_trgm", "description"),
+    )
 
 class Ingredient(Base):
     __tablename__ = "ingredients"
     id = Column(Integer, primary_key=True, index=True)
     name = Column(Text, nullable=False)
+    recipe_count = Column(Integer, nullable=False, default=0, server_default="0")
     recipes = relationship("Recipe", secondary="recipe_ingredients", back_populates="ingredients")
 
     __table_args__ = (
         Index("ix_ingredients_name_lower", func.lower(name), unique=True),
+        trigram_index("ix_ingredients_name_trgm", "name"),
     )
 
 class RecipeIngredient(Base):
@@ -104,6 +173,7 @@ class Tag(Base):
 
     __table_args__ = (
         Index("ix_tags_name_lower", func.lower(name), unique=True),
+        trigram_index("ix_tags_name_trgm", "name"),
     )
 
 class RecipeTag(Base):
@@ -115,7 +185,25 @@ class RecipeTag(Base):
 class RecipeComment(Base):
     __tablename__ = "recipe_comments"
     id = Column(Integer, primary_key=True, index=True)
-    recipe_id = Column(Integer, ForeignKey("recipes.id"), nullable=False, index=True)
+    recipe_id = Column(Integer, ForeignKey("recipes.id"), nullable=False)
     content = Column(Text, nullable=False)
     created_at = Column(TIMESTAMP, server_default=func.now())
     recipe = relationship("Recipe", back_populates="comments")
+    created_by_username = column_property(
+        select(User.username)
+        .join(CommentAuthor, CommentAuthor.user_id == User.id)
+        .where(CommentAuthor.comment_id == id)
+        .correlate_except(CommentAuthor, User)
+        .scalar_subquery()
+    )
+    like_count = column_property(
+        select(func.count(CommentLike.user_id))
+        .where(CommentLike.comment_id == id)
+        .correlate_except(CommentLike)
+        .scalar_subquery()
+    )
+
+    __table_args__ = (
+        # Serves "comments for a recipe, newest first" straight from the index; also covers recipe_id lookups
+        Index("ix_recipe_comments_recipe_created", recipe_id, created_at.desc()),
+    )
@@ -19,7 +19,7 @@ class UserPublic(BaseModel):
     username: str
     is_admin: bool
     is_super_admin: bool
-    model_config = ConfigDict(from_attributes=True)
+    model_config = ConfigDict(from_attributes=True, defer_build=True)
 
 
 class UserRoleUpdate(BaseModel):
@@ -40,7 +40,7 @@ class IngredientCreate(IngredientBase):
 class Ingredient(IngredientBase):
     id: int
     recipe_count: int = 0
-    model_config = ConfigDict(from_attributes=True)
+    model_config = ConfigDict(from_attributes=True, defer_build=True)
 
 
 class IngredientUpdate(IngredientBase):
@@ -55,7 +55,7 @@ class TagCreate(TagBase):
 
 class Tag(TagBase):
     id: int
-    model_config = ConfigDict(from_attributes=True)
+    model_config = ConfigDict(from_attributes=True, defer_build=True)
 
 
 # Comment schemas
@@ -74,7 +74,7 @@ class Comment(CommentBase):
     created_by_username: Optional[str] = None
     like_count: int = 0
     recipe_title: Optional[str] = None
-    model_config = ConfigDict(from_attributes=True)
+    model_config = ConfigDict(from_attributes=True, defer_build=True)
 
 # Recipe schemas
 class RecipeBase(BaseModel):
@@ -128,7 +128,7 @@ class Recipe(RecipeBase):
     favorite_count: int = 0
     servings: Optional[int] = None
     allowed_usernames: Optional[List[str]] = None
-    model_config = ConfigDict(from_attributes=True)
+    model_config = ConfigDict(from_attributes=True, defer_build=True)
 
 
 class RecipeFavorite(BaseModel):
@@ -0,0 +1,43 @@
+import os
+
+import pytest
+
+# Tests run against a disposable PostgreSQL database; its public schema is wiped before every test
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+if TEST_DATABASE_URL:
+    os.environ["DATABASE_URL"] = TEST_DATABASE_URL
+
+
+@pytest.fixture
+def client():
+    if not TEST_DATABASE_URL:
+        pytest.skip("TEST_DATABASE_URL is not set")
+
+    from fastapi.testclient import TestClient
+    from sqlalchemy import text
+    from backend import crud
+    from backend.database import engine
+    from backend.main import app
+
+    with engine.begin() as connection:
+        connection.execute(text("DROP SCHEMA public CASCADE"))
+        connection.execute(text("CREATE SCHEMA public"))
+    crud._SUPER_ADMIN_EXISTS = None
+    with crud._TOKEN_USER_CACHE_LOCK:
+        crud._TOKEN_USER_CACHE.clear()
+    with crud._ONLINE_DEVICE_COUNT_CACHE_LOCK:
+        crud._ONLINE_DEVICE_COUNT_CACHE.clear()
+
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def register_and_login(client):
+    def register_and_login(username: str, password: str = "secret1"):
+        assert client.post("/auth/register", json={"username": username, "password": password}).status_code == 200
+        response = client.post("/auth/login", json={"username": username, "password": password})
+        assert response.status_code == 200
+        return response.json()["user"]["id"], {"Authorization": f"Bearer {response.json()['token']}"}
+
+    return register_and_login
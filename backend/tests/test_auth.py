@@ -0,0 +1,19 @@
+from sqlalchemy import update
+
+from backend import models
+from backend.database import SessionLocal
+
+
+def test_role_change_from_another_worker_applies_to_a_cached_token(client, register_and_login):
+    _, admin = register_and_login("alice")
+    carol_id, carol = register_and_login("carol")
+    assert client.put(f"/admin/users/{carol_id}/role", json={"role": "super_admin"}, headers=admin).status_code == 200
+    # Resolves carol's token, so it is cached from here on
+    assert client.get("/admin/users", headers=carol).status_code == 200
+
+    # Another worker demotes carol; this process never sees update_user_role run
+    with SessionLocal() as db:
+        db.execute(update(models.User).where(models.User.id == carol_id).values(is_admin=False, is_super_admin=False))
+        db.commit()
+
+    assert client.get("/admin/users", headers=carol).status_code == 403
@@ -0,0 +1,16 @@
+import os
+
+import anyio.to_thread
+
+from backend.database import DB_MAX_OVERFLOW, DB_POOL_SIZE
+from backend.main import WORKER_THREAD_HEADROOM, WORKER_THREADS
+
+
+def test_lifespan_sizes_worker_threads(client):
+    limit = client.portal.call(lambda: anyio.to_thread.current_default_thread_limiter().total_tokens)
+    assert limit == WORKER_THREADS
+    if "WORKER_THREADS" not in os.environ:
+        assert limit == DB_POOL_SIZE + DB_MAX_OVERFLOW + WORKER_THREAD_HEADROOM
+    if not {"WORKER_THREADS", "DB_POOL_SIZE", "DB_MAX_OVERFLOW"} & os.environ.keys():
+        # Shipped defaults must actually move the limit off anyio's stock 40 threads
+        assert limit == 50
@@ -0,0 +1,35 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import update
+
+from backend import crud, models
+from backend.database import SessionLocal
+
+
+def online_devices(response):
+    assert response.status_code == 200, response.text
+    return response.json()["online_devices"]
+
+
+def test_heartbeat_counts_the_calling_device(client):
+    assert online_devices(client.post("/presence/heartbeat", json={"device_id": "first"})) == 1
+    assert online_devices(client.post("/presence/heartbeat", json={"device_id": "second"})) == 2
+    assert online_devices(client.post("/presence/heartbeat", json={"device_id": "second"})) == 2
+
+
+def test_heartbeat_counts_a_device_returning_from_a_stale_row(client):
+    assert online_devices(client.post("/presence/heartbeat", json={"device_id": "returning"})) == 1
+
+    with SessionLocal() as db:
+        db.execute(
+            update(models.OnlineDevicePresence)
+            .where(models.OnlineDevicePresence.device_id == "returning")
+            .values(last_seen_at=datetime.utcnow() - timedelta(hours=1))
+        )
+        db.commit()
+    # Let the earlier count expire, then warm the cache with this device missing
+    with crud._ONLINE_DEVICE_COUNT_CACHE_LOCK:
+        crud._ONLINE_DEVICE_COUNT_CACHE.clear()
+    assert online_devices(client.get("/presence/online-devices")) == 0
+
+    assert online_devices(client.post("/presence/heartbeat", json={"device_id": "returning"})) == 1
@@ -0,0 +1,53 @@
+def create_recipe(client, headers, title: str, is_public: bool = True, allowed_usernames=None):
+    payload = {"title": title, "is_public": is_public, "allowed_usernames": allowed_usernames or []}
+    response = client.post("/recipes/", json=payload, headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def page_titles(client, headers=None, **params):
+    response = client.get("/recipes/", params=params, headers=headers or {})
+    assert response.status_code == 200, response.text
+    return [recipe["title"] for recipe in response.json()]
+
+
+def test_private_recipes_do_not_shorten_pages(client, register_and_login):
+    _, admin = register_and_login("alice")
+    carol_id, carol = register_and_login("carol")
+    _, bob = register_and_login("bob")
+
+    # carol authors one private recipe while she is an admin, then loses the role
+    assert client.put(f"/admin/users/{carol_id}/role", json={"role": "admin"}, headers=admin).status_code == 200
+    create_recipe(client, carol, "public 1")
+    create_recipe(client, carol, "carol private", is_public=False)
+    assert client.put(f"/admin/users/{carol_id}/role", json={"role": "user"}, headers=admin).status_code == 200
+
+    create_recipe(client, admin, "hidden 1", is_public=False)
+    create_recipe(client, admin, "shared with bob", is_public=False, allowed_usernames=["bob"])
+    create_recipe(client, admin, "public 2")
+    create_recipe(client, admin, "hidden 2", is_public=False)
+    create_recipe(client, admin, "public 3")
+
+    assert page_titles(client, limit=2) == ["public 1", "public 2"]
+    assert page_titles(client, limit=2, offset=2) == ["public 3"]
+
+    assert page_titles(client, bob, limit=2) == ["public 1", "shared with bob"]
+    assert page_titles(client, bob, limit=2, offset=2) == ["public 2", "public 3"]
+    assert page_titles(client, bob, limit=2, offset=4) == []
+
+    assert page_titles(client, carol, limit=2) == ["public 1", "carol private"]
+    assert page_titles(client, carol, limit=2, offset=2) == ["public 2", "public 3"]
+
+    assert len(page_titles(client, admin, limit=10)) == 7
+    assert page_titles(client, admin, limit=2, offset=2) == ["hidden 1", "shared with bob"]
+
+
+def test_search_pages_over_visible_recipes(client, register_and_login):
+    _, admin = register_and_login("alice")
+    _, bob = register_and_login("bob")
+    for index in range(4):
+        create_recipe(client, admin, f"soup private {index}", is_public=False)
+        create_recipe(client, admin, f"soup public {index}")
+
+    assert page_titles(client, bob, query="soup", limit=3) == ["soup public 0", "soup public 1", "soup public 2"]
+    assert page_titles(client, bob, query="soup", limit=3, offset=3) == ["soup public 3"]